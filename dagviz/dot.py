@@ -0,0 +1,146 @@
+import io
+import re
+import subprocess
+from itertools import islice
+from typing import Any, Dict, Iterable, Optional, TextIO, Tuple
+
+# Matches DOT escapes that are kept as given (\n, \l, \r line breaks, \" and \\),
+# then any other backslash, quote or newline, which need escaping
+_ESCAPE_RE = re.compile(r'\\[nlr"\\]|[\\"\n]')
+_ESCAPES = {'\\': '\\\\', '"': '\\"', '\n': '\\n'}
+
+def _quote(value: Any) -> str:
+    """Quote a value as a DOT string; backslash escapes like \\n are kept for Graphviz"""
+    return '"' + _ESCAPE_RE.sub(lambda m: _ESCAPES.get(m.group(0), m.group(0)), str(value)) + '"'
+
+def _format_attrs(attrs: Dict[str, Any]) -> str:
+    """Format scalar attributes as a DOT attribute list body"""
+    return ', '.join(f'{key}={_quote(value)}' for key, value in attrs.items()
+                     if isinstance(value, (str, int, float)))
+
+def _write_header(out: TextIO, directed: bool, name: Optional[str], attrs: Dict[str, Any]):
+    """Write the opening line of a DOT graph and its graph-level attributes"""
+    kind = 'digraph' if directed else 'graph'
+    out.write(f'{kind} {_quote(name or "G")} {{\n')
+    graph_attrs = _format_attrs(attrs.get('graph_attrs', {}))
+    if graph_attrs:
+        out.write(f'  graph [{graph_attrs}];\n')
+
+def _node_line(i: int, name: str, label: str, shape: str, attrs: Dict[str, Any]) -> str:
+    return f'  {_quote(name)} [{_format_attrs({"id": f"n{i}", "label": label, "shape": shape, **attrs})}];\n'
+
+def _edge_line(k: int, source: str, target: str, edge_op: str, attrs: Dict[str, Any]) -> str:
+    return f'  {_quote(source)} {edge_op} {_quote(target)} [{_format_attrs({"id": f"e{k}", **attrs})}];\n'
+
+def write_dot(graph, out: TextIO):
+    """Write graph as Graphviz DOT source
+
+    Nodes get SVG ids "n<i>" matching their position in graph.id_index(),
+    which includes endpoints that only appear in edges, and edges get
+    "e<k>" matching their position in graph.edges.
+    """
+    edge_op = '->' if graph.directed else '--'
+    _write_header(out, graph.directed, graph.name, graph.attrs)
+    for i, node in enumerate(graph.nodes.values()):
+        out.write(_node_line(i, node.name, node.label, node.shape, node.attrs))
+    # Declare edge-only endpoints too, so they get their index id rather than Graphviz's
+    for name, i in islice(graph.id_index().items(), len(graph.nodes), None):
+        out.write(f'  {_quote(name)} [id="n{i}"];\n')
+    for k, edge in enumerate(graph.edges):
+        out.write(_edge_line(k, edge.source, edge.target, edge_op, edge.attrs))
+    out.write('}\n')
+
+class DotWriter:
+    """Writes nodes and edges straight to a DOT file instead of keeping them in a Graph
+
+    Mirrors the node()/edge()/add_nodes()/add_edges()/add_edge_pairs()
+    methods of Graph.
+    Only node names are kept in memory, so repeated nodes are still
+    skipped. Use as a context manager; the closing brace is written on exit.
+    """
+
+    def __init__(self, path: str, directed: bool = True,
+                 name: Optional[str] = None, attrs: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.directed = directed
+        self._edge_op = '->' if directed else '--'
+        self._seen = set()
+        self._edge_count = 0
+        self._file = open(path, 'w', encoding='utf-8')
+        _write_header(self._file, directed, name, attrs or {})
+
+    def node(self, name: str, label: Optional[str] = None,
+             attrs: Optional[Dict[str, Any]] = None, **kwargs):
+        """Write a node; nodes that were already written are skipped"""
+        if kwargs:
+            attrs = {**attrs, **kwargs} if attrs else kwargs
+        return self.add_nodes([(name, label, attrs)])
+
+    def edge(self, source: str, target: str,
+             attrs: Optional[Dict[str, Any]] = None, **kwargs):
+        """Write an edge"""
+        if kwargs:
+            attrs = {**attrs, **kwargs} if attrs else kwargs
+        return self.add_edges([(source, target, attrs)])
+
+    def add_nodes(self, nodes: Iterable[Tuple[str, Optional[str], Dict[str, Any]]]):
+        """Write many nodes at once from (name, label, attrs) tuples"""
+        seen = self._seen
+        write = self._file.write
+        for name, label, attrs in nodes:
+            if name in seen:
+                continue
+            attrs = attrs or {}
+            write(_node_line(len(seen), name, label or name, attrs.get('shape', 'rect'), attrs))
+            seen.add(name)
+        return self
+
+    def add_edges(self, edges: Iterable[Tuple[str, str, Dict[str, Any]]]):
+        """Write many edges at once from (source, target, attrs) tuples"""
+        write = self._file.write
+        for source, target, attrs in edges:
+            write(_edge_line(self._edge_count, source, target, self._edge_op, attrs or {}))
+            self._edge_count += 1
+        return self
+
+    def add_edge_pairs(self, pairs: Iterable[Tuple[str, str]],
+                       attrs: Optional[Dict[str, Any]] = None):
+        """Write many edges at once from (source, target) pairs that all share one attrs dict"""
+        # Format the shared attributes once; only the edge id differs per line
+        shared = _format_attrs(attrs or {})
+        shared = f', {shared}' if shared else ''
+        edge_op = self._edge_op
+        k = self._edge_count
+        write = self._file.write
+        for source, target in pairs:
+            write(f'  {_quote(source)} {edge_op} {_quote(target)} [id="e{k}"{shared}];\n')
+            k += 1
+        self._edge_count = k
+        return self
+
+    def close(self):
+        """Write the closing brace and close the file"""
+        if not self._file.closed:
+            self._file.write('}\n')
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def to_svg(graph) -> str:
+    """Lay out graph with Graphviz dot and return the SVG markup"""
+    source = io.StringIO()
+    write_dot(graph, source)
+    try:
+        result = subprocess.run(['dot', '-Tsvg'], input=source.getvalue().encode('utf-8'),
+                                capture_output=True, check=True)
+    except FileNotFoundError:
+        raise RuntimeError("Graphviz 'dot' executable not found; install Graphviz for static rendering")
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Graphviz 'dot' failed: {e.stderr.decode('utf-8', 'replace').strip()}")
+    svg = result.stdout.decode('utf-8')
+    # Drop the XML prolog and doctype so the SVG can be inlined in HTML
+    return svg[svg.index('<svg'):]
@@ -1,33 +1,45 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Iterable, Tuple, ClassVar, BinaryIO
+from itertools import islice
 import json
-from .render import render, view as render_view
+from .render import render, view as render_view, _dumps
+from .dot import DotWriter
+
+# Number of nodes/edges encoded per write in Graph.write_json
+_JSON_BATCH_SIZE = 1024
 
 class Node:
     """Represents a node in the graph"""
-    def __init__(self, name: str, label: Optional[str] = None, **attrs):
+    __slots__ = ('name', 'label', 'shape', 'attrs')
+
+    def __init__(self, name: str, label: Optional[str] = None,
+                 attrs: Optional[Dict[str, Any]] = None):
         self.name = name
         self.label = label or name
-        # Convert newlines in labels to HTML line breaks
-        if '\n' in self.label:
-            self.label = self.label.replace('\n', '<br/>')
+        # attrs is stored as given (not copied), so one style dict can be shared by many nodes
+        self.attrs = attrs if attrs is not None else {}
         # Handle shape attribute specially
-        self.shape = attrs.pop('shape', 'rect')
-        self.attrs = attrs
+        self.shape = self.attrs.get('shape', 'rect')
+
+    def html_label(self) -> str:
+        """Label with newlines converted to HTML line breaks"""
+        return self.label.replace('\n', '<br/>')
 
     def to_dict(self) -> Dict[str, Any]:
         return {
             "id": self.name,
-            "label": self.label,
+            "label": self.html_label(),
             "shape": self.shape,
             **self.attrs
         }
 
 class Edge:
     """Represents an edge in the graph"""
-    def __init__(self, source: str, target: str, **attrs):
+    __slots__ = ('source', 'target', 'attrs')
+
+    def __init__(self, source: str, target: str, attrs: Optional[Dict[str, Any]] = None):
         self.source = source
         self.target = target
-        self.attrs = attrs
+        self.attrs = attrs if attrs is not None else {}
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -38,35 +50,138 @@ class Edge:
 
 class Graph:
     """Base class for undirected graphs"""
+    directed: ClassVar[bool] = False
+
     def __init__(self, name: Optional[str] = None, **attrs):
         self.name = name
         self.attrs = attrs
         self.nodes: Dict[str, Node] = {}
         self.edges: List[Edge] = []
 
-    def node(self, name: str, label: Optional[str] = None, **attrs):
-        """Add a node to the graph"""
-        self.nodes[name] = Node(name, label, **attrs)
+    def node(self, name: str, label: Optional[str] = None,
+             attrs: Optional[Dict[str, Any]] = None, **kwargs):
+        """Add a node to the graph; nodes that already exist are left unchanged
+
+        Attributes come from the attrs dict, with any keyword arguments merged on top.
+        """
+        if name in self.nodes:
+            return self
+        if kwargs:
+            attrs = {**attrs, **kwargs} if attrs else kwargs
+        self.nodes[name] = Node(name, label, attrs)
+        return self
+
+    def edge(self, source: str, target: str,
+             attrs: Optional[Dict[str, Any]] = None, **kwargs):
+        """Add an edge to the graph
+
+        Attributes come from the attrs dict, with any keyword arguments merged on top.
+        """
+        if kwargs:
+            attrs = {**attrs, **kwargs} if attrs else kwargs
+        self.edges.append(Edge(source, target, attrs))
+        return self
+
+    def add_nodes(self, nodes: Iterable[Tuple[str, Optional[str], Dict[str, Any]]]):
+        """Add many nodes at once from (name, label, attrs) tuples; existing nodes are skipped"""
+        existing = self.nodes
+        for name, label, attrs in nodes:
+            if name not in existing:
+                existing[name] = Node(name, label, attrs)
         return self
 
-    def edge(self, source: str, target: str, **attrs):
-        """Add an edge to the graph"""
-        self.edges.append(Edge(source, target, **attrs))
+    def add_edges(self, edges: Iterable[Tuple[str, str, Dict[str, Any]]]):
+        """Add many edges at once from (source, target, attrs) tuples"""
+        self.edges.extend(Edge(source, target, attrs) for source, target, attrs in edges)
         return self
 
+    def add_edge_pairs(self, pairs: Iterable[Tuple[str, str]],
+                       attrs: Optional[Dict[str, Any]] = None):
+        """Add many edges at once from (source, target) pairs that all share one attrs dict"""
+        self.edges.extend(Edge(source, target, attrs) for source, target in pairs)
+        return self
+
+    def id_index(self) -> Dict[str, int]:
+        """Map node names to their position in the id table, including edge-only endpoints"""
+        index = {name: i for i, name in enumerate(self.nodes)}
+        for edge in self.edges:
+            index.setdefault(edge.source, len(index))
+            index.setdefault(edge.target, len(index))
+        return index
+
+    @staticmethod
+    def _edge_entry(edge: Edge, index: Dict[str, int]) -> List[Any]:
+        """Encode an edge as [source_idx, target_idx] plus its attrs, if any"""
+        if edge.attrs:
+            return [index[edge.source], index[edge.target], edge.attrs]
+        return [index[edge.source], index[edge.target]]
+
     def to_dict(self) -> Dict[str, Any]:
-        """Convert graph to dictionary format"""
+        """Convert graph to dictionary format
+
+        Node names are stored once in "ids"; nodes are listed in the same
+        order without their id, and edges refer to nodes by index.
+        """
+        index = self.id_index()
         return {
-            "directed": isinstance(self, Digraph),
+            "directed": self.directed,
             "name": self.name,
             "attrs": self.attrs,
-            "nodes": [node.to_dict() for node in self.nodes.values()],
-            "edges": [edge.to_dict() for edge in self.edges]
+            "ids": list(index),
+            "nodes": [{"label": n.html_label(), "shape": n.shape, **n.attrs} for n in self.nodes.values()],
+            "edges": [self._edge_entry(e, index) for e in self.edges]
         }
 
-    def render(self, filename: Optional[str] = None, view: bool = True) -> Optional[str]:
+    def write_json(self, out: BinaryIO):
+        """Write graph as JSON to a binary file, encoding nodes/edges in batches
+
+        Produces the same structure as to_dict() while only holding one
+        batch of node/edge dicts at a time. "</" is escaped so the output
+        can be embedded in a <script> block.
+        """
+        index = self.id_index()
+        header = _dumps({
+            "directed": self.directed,
+            "name": self.name,
+            "attrs": self.attrs,
+            "ids": list(index)
+        })
+        out.write(header[:-1].replace(b'</', b'<\\/') + b',"nodes":')
+        self._write_batches(out, (
+            {"label": node.html_label(), "shape": node.shape, **node.attrs}
+            for node in self.nodes.values()
+        ))
+        out.write(b',"edges":')
+        self._write_batches(out, (self._edge_entry(edge, index) for edge in self.edges))
+        out.write(b'}')
+
+    @staticmethod
+    def _write_batches(out: BinaryIO, items: Iterable[Any]):
+        """Write items as a JSON array, encoding a batch of items per call"""
+        items = iter(items)
+        sep = b'['
+        while True:
+            batch = list(islice(items, _JSON_BATCH_SIZE))
+            if not batch:
+                break
+            out.write(sep + _dumps(batch)[1:-1].replace(b'</', b'<\\/'))
+            sep = b','
+        out.write(b']' if sep == b',' else b'[]')
+
+    def render(self, filename: Optional[str] = None, view: bool = True,
+               encoding: str = 'json', compress: bool = False,
+               mode: str = 'interactive', format: str = 'html') -> Optional[str]:
         """Render the graph to a file"""
-        return render(self, filename, view)
+        return render(self, filename, view, encoding, compress, mode, format)
+
+    def stream_to(self, path: str) -> DotWriter:
+        """Open a DOT file that nodes and edges are written to as they are added
+
+        The returned writer has the same node()/edge()/add_nodes()/add_edges()/
+        add_edge_pairs() methods as the graph but does not keep them in memory;
+        use it as a context manager so the file is closed.
+        """
+        return DotWriter(path, self.directed, self.name, self.attrs)
 
     def view(self):
         """Render the graph and open in browser"""
@@ -74,4 +189,4 @@ class Graph:
 
 class Digraph(Graph):
     """Directed graph"""
-    pass 
\ No newline at end of file
+    directed: ClassVar[bool] = True 
\ No newline at end of file
@@ -1,10 +1,26 @@
-import json
+import base64
+import gzip
+import io
 import os
+import sys
 import tempfile
 import webbrowser
 from pathlib import Path
 from typing import Union, Optional
 
+from .dot import to_svg
+
+try:
+    import orjson
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    import json
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
 # HTML template with embedded dagre-d3
 _TEMPLATE = '''
 <!DOCTYPE html>
@@ -13,7 +29,7 @@ _TEMPLATE = '''
     <meta charset="utf-8">
     <title>{title}</title>
     <script src="https://d3js.org/d3.v7.min.js"></script>
-    <script src="https://dagrejs.github.io/project/dagre-d3/latest/dagre-d3.min.js"></script>
+    <script src="https://dagrejs.github.io/project/dagre-d3/latest/dagre-d3.min.js"></script>{extra_scripts}
     <style>
         body {{
             margin: 0;
@@ -93,9 +109,20 @@ _TEMPLATE = '''
 <body>
     <div id="debug"></div>
     <svg id="graph" width="100%" height="95vh"></svg>
-    <script>
+    <script type="module">
         // Debug info
         const debug = document.getElementById('debug');
+
+        // Decode a base64 payload to bytes
+        function fromBase64(b64) {{
+            return Uint8Array.from(atob(b64), c => c.charCodeAt(0));
+        }}
+
+        // Decode and gunzip a base64 payload
+        async function inflate(b64) {{
+            const stream = new Blob([fromBase64(b64)]).stream().pipeThrough(new DecompressionStream('gzip'));
+            return new Uint8Array(await new Response(stream).arrayBuffer());
+        }}
         
         try {{
             // Graph data
@@ -116,8 +143,12 @@ _TEMPLATE = '''
                 marginy: 20
             }});
 
+            // Node names are stored once in the id table; nodes and edges refer to them by index
+            const ids = graphData.ids;
+
             // Add nodes
-            graphData.nodes.forEach(node => {{
+            graphData.nodes.forEach((node, i) => {{
+                node.id = ids[i];
                 const isOperator = node.class === 'node-oval';
                 g.setNode(node.id, {{
                     label: node.label,
@@ -133,7 +164,7 @@ _TEMPLATE = '''
 
             // Add edges
             graphData.edges.forEach(edge => {{
-                g.setEdge(edge.source, edge.target, {{
+                g.setEdge(ids[edge[0]], ids[edge[1]], {{
                     curve: d3.curveBasis,
                     arrowheadClass: 'arrowhead'
                 }});
@@ -261,28 +292,246 @@ _TEMPLATE = '''
 </html>
 '''
 
-def render(graph, filename: Optional[str] = None, view: bool = True) -> Optional[str]:
-    """Render graph to HTML file"""
-    if filename is None:
-        filename = tempfile.mktemp(suffix='.html')
+# Split around the data so the (potentially huge) JSON can be streamed straight to the file
+_PREFIX_TEMPLATE, _SUFFIX = _TEMPLATE.split('{graph_data}')
+_SUFFIX = _SUFFIX.format().encode('utf-8')  # unescape doubled braces
+
+# HTML template for graphs laid out ahead of time by Graphviz
+_STATIC_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>{title}</title>
+    <script src="https://d3js.org/d3.v7.min.js"></script>
+    <style>
+        body {{
+            margin: 0;
+            padding: 20px;
+        }}
+        #graph svg {{
+            width: 100%;
+            height: 95vh;
+            border: 1px solid #ccc;
+        }}
+        .node.highlight-parent polygon, .node.highlight-parent ellipse {{
+            stroke: #FFA000;  /* Amber 700 */
+            stroke-width: 3px;
+            fill: #FFE082;    /* Amber 200 */
+        }}
+        .node.highlight-self polygon, .node.highlight-self ellipse {{
+            stroke: #1976D2;  /* Blue 700 */
+            stroke-width: 3px;
+            fill: #90CAF9;    /* Blue 200 */
+        }}
+        .node.highlight-child polygon, .node.highlight-child ellipse {{
+            stroke: #388E3C;  /* Green 700 */
+            stroke-width: 3px;
+            fill: #A5D6A7;    /* Green 200 */
+        }}
+        .edge.highlight-parent path {{
+            stroke: #FFA000;  /* Amber 700 */
+            stroke-width: 2.5px;
+        }}
+        .edge.highlight-child path {{
+            stroke: #388E3C;  /* Green 700 */
+            stroke-width: 2.5px;
+        }}
+    </style>
+</head>
+<body>
+    <div id="graph">{svg}</div>
+    <script>
+        // [source, target] node index per edge; nodes/edges have SVG ids n<i>/e<k>
+        const edges = {edges};
+        const inEdges = new Map(), outEdges = new Map();
+        edges.forEach(([s, t], k) => {{
+            if (!outEdges.has(s)) outEdges.set(s, []);
+            if (!inEdges.has(t)) inEdges.set(t, []);
+            outEdges.get(s).push(k);
+            inEdges.get(t).push(k);
+        }});
+
+        const svg = d3.select("#graph svg").attr("width", null).attr("height", null);
+
+        // Wrap the Graphviz output in a group so zooming keeps its own transform
+        const inner = svg.append("g");
+        inner.node().appendChild(svg.select("g.graph").node());
+        const zoom = d3.zoom()
+            .scaleExtent([0.1, 4])
+            .on("zoom", (e) => {{
+                inner.attr("transform", e.transform);
+            }});
+        svg.call(zoom);
+
+        let activeNode = null;
+
+        function clearHighlights() {{
+            inner.selectAll(".highlight-parent, .highlight-self, .highlight-child")
+                .classed("highlight-parent highlight-self highlight-child", false);
+        }}
+
+        function highlightNode(i) {{
+            clearHighlights();
+            inner.select(`#n${{i}}`).classed("highlight-self", true);
+            (inEdges.get(i) || []).forEach(k => {{
+                inner.select(`#e${{k}}`).classed("highlight-parent", true);
+                inner.select(`#n${{edges[k][0]}}`).classed("highlight-parent", true);
+            }});
+            (outEdges.get(i) || []).forEach(k => {{
+                inner.select(`#e${{k}}`).classed("highlight-child", true);
+                inner.select(`#n${{edges[k][1]}}`).classed("highlight-child", true);
+            }});
+        }}
+
+        svg.on("click", function(event) {{
+            if (event.target.tagName === "svg") {{
+                clearHighlights();
+                activeNode = null;
+            }}
+        }});
+
+        inner.selectAll("g.node")
+            .on("click", function(evt) {{
+                evt.stopPropagation();
+                const i = +this.id.slice(1);
+                if (activeNode === i) {{
+                    clearHighlights();
+                    activeNode = null;
+                }} else {{
+                    highlightNode(i);
+                    activeNode = i;
+                }}
+            }})
+            .on("mouseover", function() {{
+                if (activeNode === null) {{
+                    highlightNode(+this.id.slice(1));
+                }}
+            }})
+            .on("mouseout", function() {{
+                if (activeNode === null) {{
+                    clearHighlights();
+                }}
+            }});
+    </script>
+</body>
+</html>
+'''
+
+# Large write buffer so multi-MB pages are flushed in few syscalls
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# Decoder loaded in the page for each supported payload encoding
+_ENCODING_SCRIPTS = {
+    'json': '',
+    'msgpack': '\n    <script src="https://unpkg.com/@msgpack/msgpack"></script>',
+}
+
+# JS expression that decodes a base64 payload, keyed by (encoding, compress)
+_DECODE_EXPRESSIONS = {
+    ('json', True): b'JSON.parse(new TextDecoder().decode(await inflate("%s")))',
+    ('msgpack', False): b'MessagePack.decode(fromBase64("%s"))',
+    ('msgpack', True): b'MessagePack.decode(await inflate("%s"))',
+}
+
+def render(graph, filename: Optional[str] = None, view: bool = True,
+           encoding: str = 'json', compress: bool = False,
+           mode: str = 'interactive', format: str = 'html') -> Optional[str]:
+    """Render graph to HTML file, embedding the graph data as 'json' or base64 'msgpack'
+
+    With compress=True the payload is gzipped and inflated in the browser.
+    mode='static' lays the graph out with Graphviz instead and embeds the
+    resulting SVG, which is much faster to open for large graphs.
+    format='svg' or 'json' writes the bare Graphviz SVG or graph JSON
+    instead of an HTML page; encoding, compress and mode don't apply.
+    """
+    if format in ('svg', 'json'):
+        return _render_raw(graph, filename, view, format)
+    if format != 'html':
+        raise ValueError(f"Unknown format: {format!r}")
+    if mode == 'static':
+        return _render_static(graph, filename, view)
+    if mode != 'interactive':
+        raise ValueError(f"Unknown mode: {mode!r}")
+    if encoding not in _ENCODING_SCRIPTS:
+        raise ValueError(f"Unknown encoding: {encoding!r}")
+    prefix = _PREFIX_TEMPLATE.format(
+        title=graph.name or "Graph Visualization",
+        extra_scripts=_ENCODING_SCRIPTS[encoding]
+    )
     
-    # Convert graph to JSON for embedding
-    graph_data = json.dumps(graph.to_dict())
+    f, filename = _open_output(filename)
+    with f:
+        f.write(prefix.encode('utf-8'))
+        if encoding == 'json' and not compress:
+            # Stream the JSON in batches between the template halves
+            graph.write_json(f)
+        else:
+            if encoding == 'msgpack':
+                import msgpack
+                data = msgpack.packb(graph.to_dict())
+            else:
+                buf = io.BytesIO()
+                graph.write_json(buf)
+                data = buf.getvalue()
+            if compress:
+                data = gzip.compress(data, compresslevel=6)
+            f.write(_DECODE_EXPRESSIONS[encoding, compress] % base64.b64encode(data))
+        f.write(_SUFFIX)
     
-    # Generate HTML
-    html = _TEMPLATE.format(
+    return _finish(filename, view)
+
+def _render_static(graph, filename: Optional[str], view: bool) -> Optional[str]:
+    """Render graph to HTML file with a Graphviz-computed SVG layout"""
+    index = graph.id_index()
+    html = _STATIC_TEMPLATE.format(
         title=graph.name or "Graph Visualization",
-        graph_data=graph_data
+        svg=to_svg(graph),
+        edges=_dumps([[index[e.source], index[e.target]] for e in graph.edges]).decode('utf-8')
     )
     
-    # Write to file
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(html)
+    f, filename = _open_output(filename)
+    with f:
+        f.write(html.encode('utf-8'))
+    
+    return _finish(filename, view)
+
+def _render_raw(graph, filename: Optional[str], view: bool, format: str) -> Optional[str]:
+    """Render graph to a bare SVG or JSON file"""
+    svg = to_svg(graph) if format == 'svg' else None
     
-    if view:
+    f, filename = _open_output(filename, suffix=f'.{format}')
+    with f:
+        if svg is not None:
+            f.write(svg.encode('utf-8'))
+        else:
+            graph.write_json(f)
+    
+    return _finish(filename, view)
+
+def _open_output(filename: Optional[str], suffix: str = '.html'):
+    """Open the output file for writing, creating a temp file if no filename is given"""
+    if filename is None:
+        f = tempfile.NamedTemporaryFile(mode='wb', suffix=suffix, delete=False,
+                                        buffering=_WRITE_BUFFER_SIZE)
+        return f, f.name
+    return open(filename, 'wb', buffering=_WRITE_BUFFER_SIZE), filename
+
+def _should_open() -> bool:
+    """Whether opening a browser makes sense: not in CI, not disabled, not headless Linux"""
+    if os.environ.get('CI') or os.environ.get('DAGVIZ_NO_BROWSER'):
+        return False
+    if sys.platform.startswith('linux'):
+        return any(os.environ.get(var) for var in ('DISPLAY', 'WAYLAND_DISPLAY', 'BROWSER'))
+    return True
+
+def _finish(filename: str, view: bool) -> Optional[str]:
+    """Open the rendered file in a browser if requested; return the filename if it wasn't opened"""
+    if view and _should_open():
         webbrowser.open(f'file://{os.path.abspath(filename)}')
+        return None
     
-    return filename if not view else None
+    return filename
 
 def view(graph):
     """Render graph and open in browser"""
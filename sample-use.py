@@ -1,51 +1,69 @@
+import functools
+import hashlib
+import itertools
+import os
+import re
+import sys
+import tempfile
 import onnx
 from dagviz import Digraph
+from dagviz.dot import DotWriter
 
+@functools.lru_cache(maxsize=None)
 def truncate_name(name, max_length=40):
     """Truncate long names and add ellipsis"""
     if len(name) > max_length:
         return name[:max_length-3] + "..."
     return name
 
+# Common prefixes stripped from node names, in the order they are tried
+_PREFIXES = ['/model/', 'model.', '/output_0', '/input_0', 'attn_mask_reformat/attn_mask_subgraph/']
+_LEADING_PREFIX_RE = re.compile('^' + ''.join(f'(?:{re.escape(p)})?' for p in _PREFIXES))
+_SLASH_PREFIX_RE = re.compile('/(?:' + '|'.join(re.escape(p) for p in _PREFIXES) + ')')
+
+# Common patterns to simplify
+_REPLACEMENTS = {
+    'layers.': 'L',
+    'attention': 'attn',
+    'layernorm': 'LN',
+    'input_': 'in_',
+    'output_': 'out_',
+    'weight': 'w',
+    'MatMul': 'MM',
+    'ReduceSum': 'RSum',
+    'Constant': 'Const',
+    'Gather': 'Gath',
+    'constant_nodes': 'const',
+    'TensorProto': 'TP',
+    'subgraph': 'sg',
+    'reformat': 'fmt',
+}
+_REPLACEMENTS_RE = re.compile('|'.join(re.escape(k) for k in sorted(_REPLACEMENTS, key=len, reverse=True)))
+
+@functools.lru_cache(maxsize=None)
 def clean_name(name, max_length=30):
     """Clean and shorten node names"""
-    # Remove common prefixes
-    prefixes_to_remove = ['/model/', 'model.', '/output_0', '/input_0', 'attn_mask_reformat/attn_mask_subgraph/']
     name = name.replace('\\n', '\n')  # Handle escaped newlines
     
-    for prefix in prefixes_to_remove:
-        if name.startswith(prefix):
-            name = name[len(prefix):]
-        # Also check after slashes
-        name = name.replace('/' + prefix, '/')
-    
-    # Simplify common patterns
-    replacements = {
-        'layers.': 'L',
-        'attention': 'attn',
-        'layernorm': 'LN',
-        'input_': 'in_',
-        'output_': 'out_',
-        'weight': 'w',
-        'MatMul': 'MM',
-        'ReduceSum': 'RSum',
-        'Constant': 'Const',
-        'Gather': 'Gath',
-        'constant_nodes': 'const',
-        'TensorProto': 'TP',
-        'subgraph': 'sg',
-        'reformat': 'fmt',
-    }
+    # Remove common prefixes after slashes, then at the start
+    name = _SLASH_PREFIX_RE.sub('/', name)
+    name = _LEADING_PREFIX_RE.sub('', name, count=1)
     
-    for old, new in replacements.items():
-        name = name.replace(old, new)
+    # Simplify common patterns in a single pass
+    name = _REPLACEMENTS_RE.sub(lambda m: _REPLACEMENTS[m.group(0)], name)
     
-    # Handle paths
-    if '/' in name:
-        parts = name.split('/')
-        if len(parts) > 2:
+    # Handle paths with at least two slashes
+    first, _, rest = name.partition('/')
+    if '/' in rest:
+        mid, _, last = rest.rpartition('/')
+        if first and last and not first.isdigit() and not last.isdigit():
+            # First and last parts are kept as is; a middle part is meaningful
+            # if it is not empty or all digits, i.e. it has a non-digit character
+            mid = mid.replace('/', '')
+            name = f"{first}/../{last}" if mid and not mid.isdigit() else f"{first}/{last}"
+        else:
             # Keep first and last meaningful parts
-            filtered_parts = [p for p in parts if p and not p.isdigit()]
+            filtered_parts = [p for p in name.split('/') if p and not p.isdigit()]
             if len(filtered_parts) > 2:
                 name = f"{filtered_parts[0]}/../{filtered_parts[-1]}"
             else:
@@ -57,53 +75,56 @@ def clean_name(name, max_length=30):
             
     return name
 
+@functools.lru_cache(maxsize=None)
 def escape_name(name):
     """Escape special characters in names"""
     return name.replace(':', '<colon>').replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
 
+# Short names for common dimension names
+_DIM_SHORTS = {
+    'batch_size': 'B',
+    'sequence_length': 'S',
+    'hidden_size': 'H',
+    'num_heads': 'N',
+    'head_size': 'HS',
+    'vocab_size': 'V',
+    'num_layers': 'L',
+    'total_sequence_length': 'T'
+}
+_DIM_SHORTS_RE = re.compile('|'.join(re.escape(k) for k in sorted(_DIM_SHORTS, key=len, reverse=True)))
+
+@functools.lru_cache(maxsize=None)
 def format_shape(shape):
-    """Format shape list to be more readable"""
+    """Format shape tuple to be more readable"""
     if not shape or shape == "?":
         return "?"
     
     def format_dim(d, pos=None):
         """Format a single dimension value with position context"""
         if isinstance(d, str):
-            # Replace common dimension names
-            replacements = {
-                'batch_size': 'B',
-                'sequence_length': 'S',
-                'hidden_size': 'H',
-                'num_heads': 'N',
-                'head_size': 'HS',
-                'vocab_size': 'V',
-                'num_layers': 'L',
-                'total_sequence_length': 'T'
-            }
-            for full, short in replacements.items():
-                if full in d:
-                    return short
-            return d
+            # Replace common dimension names; dim_params usually match one exactly
+            short = _DIM_SHORTS.get(d)
+            if short is not None:
+                return short
+            match = _DIM_SHORTS_RE.search(d)
+            return _DIM_SHORTS[match.group(0)] if match else d
         else:
-            # Format numbers for readability
-            try:
-                num = int(d)
-                if num >= 1024:
-                    val = f"{num//1024}K" if num % 1024 == 0 else f"{num//1000}k"
-                else:
-                    val = str(num)
-                
-                # Add meaning based on position and value
-                if pos is not None:
-                    if num == 8 and pos in [1, -3]:  # Often num_heads
-                        return f"{val}N"  # N heads
-                    elif num == 64 and pos in [-1, -2]:  # Often head_dim
-                        return f"{val}D"  # head Dimension
-                    elif num in [2048, 4096] and pos == -1:  # Often hidden_size
-                        return f"{val}H"  # Hidden size
-                return val
-            except (ValueError, TypeError):
-                return str(d)
+            # Format numbers for readability; harvested dims are always ints
+            num = d
+            if num >= 1024:
+                val = f"{num//1024}K" if num % 1024 == 0 else f"{num//1000}k"
+            else:
+                val = str(num)
+
+            # Add meaning based on position and value
+            if pos is not None:
+                if num == 8 and pos in [1, -3]:  # Often num_heads
+                    return f"{val}N"  # N heads
+                elif num == 64 and pos in [-1, -2]:  # Often head_dim
+                    return f"{val}D"  # head Dimension
+                elif num in [2048, 4096] and pos == -1:  # Often hidden_size
+                    return f"{val}H"  # Hidden size
+            return val
     
     # Format each dimension with position context
     if isinstance(shape, (list, tuple)):
@@ -121,116 +142,294 @@ def format_shape(shape):
         return f"[{', '.join(dims)}]"
     return str(shape)
 
-def convert_onnx_model_to_graph(model_path):
-    # Load the ONNX model
-    model = onnx.load(model_path)
-    model = onnx.shape_inference.infer_shapes(model)
+# Styles shared by every node/edge of a kind; the graph stores them by reference
+_IO_NODE_ATTRS = {
+    'style': 'filled, rounded',
+    'shape': 'box',
+    'margin': '0.3',
+    'width': '1.8',   # Slightly wider for better text fit
+    'height': '0.6',
+    'fixedsize': 'true',
+    'fontsize': '10'
+}
+_OP_NODE_ATTRS = {
+    'shape': 'box',
+    'style': 'filled',
+    'fillcolor': '#e1f5fe',
+    'margin': '0.3',
+    'width': '1.2',
+    'height': '0.6',
+    'fixedsize': 'true'
+}
+_EDGE_ATTRS = {'penwidth': '0.5', 'arrowsize': '0.5'}
 
-    # Create a new directed graph
-    G = Digraph('ONNX Model Graph', 
-                graph_attrs={'rankdir': 'TB', 'splines': 'ortho'})
+# TensorProto fields holding tensor values; drawing only needs the dims
+_TENSOR_DATA_FIELDS = ('raw_data', 'float_data', 'int32_data', 'string_data',
+                       'int64_data', 'double_data', 'uint64_data')
+
+# Per-user cache of shape-inferred models, kept private since cached models are loaded as-is
+_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'dagviz')
 
-    # Track shapes
-    shape_info = {}
+def load_inferred_model(model_path):
+    """Load the model with inferred shapes, reusing a cached copy from a previous run
 
-    # Get shapes from initializers
+    The cache lives in ~/.cache/dagviz, keyed by path, mtime, size and onnx version.
+    Models whose value_info already covers at least half their nodes are
+    returned as loaded, without shape inference. Initializer values are
+    dropped from the cached copy, so it only holds the graph structure.
+    Set DAGVIZ_NO_CACHE to neither read nor write the cache.
+    """
+    use_cache = not os.environ.get('DAGVIZ_NO_CACHE')
+    stat = os.stat(model_path)
+    key = hashlib.sha1(
+        f"{os.path.abspath(model_path)}|{stat.st_mtime}|{stat.st_size}|{onnx.__version__}".encode()
+    ).hexdigest()
+    cache_path = os.path.join(_CACHE_DIR, f"{key}.onnx")
+    if use_cache and os.path.exists(cache_path):
+        return onnx.load(cache_path, load_external_data=False)
+
+    # Weights aren't needed for the graph structure, so leave external data on disk;
+    # what is loaded is then well under protobuf's 2GB limit even for large models
+    model = onnx.load(model_path, load_external_data=False)
+    # Exports that already carry most intermediate shapes don't need another pass
+    if len(model.graph.value_info) >= len(model.graph.node) // 2:
+        return model
+    model = onnx.shape_inference.infer_shapes(model)
+    if not use_cache:
+        return model
+
+    # Shape inference may read initializer values (e.g. Reshape targets), so
+    # only drop them now; the cached copy is then a fraction of the model's size
     for init in model.graph.initializer:
-        shape_info[init.name] = [d for d in init.dims]
+        for field in _TENSOR_DATA_FIELDS:
+            init.ClearField(field)
+
+    # Write to a fresh temp file first so an interrupted run can't leave a broken cache
+    os.makedirs(_CACHE_DIR, mode=0o700, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=_CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            onnx.save(model, f)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return model
+
+def get_shape_from_type_proto(type_proto):
+    """Get a tensor type's shape as a tuple of dim values/params, or None if it has no dims"""
+    if not type_proto.HasField("tensor_type"):
+        return None
+    dims = type_proto.tensor_type.shape.dim
+    if not dims:
+        return None
+    return tuple(d.dim_value or d.dim_param for d in dims)
+
+class LazyShapes:
+    """Tensor name -> shape lookup that reads each shape from the model on first use
 
-    # Get shapes from inputs
-    for node in model.graph.input:
-        dim = node.type.tensor_type.shape.dim
-        shape_info[node.name] = [d.dim_param if d.dim_value == 0 else d.dim_value for d in dim]
+    Shapes come from value_info, outputs, inputs and initializers, in that
+    order of precedence. Only the protos are indexed up front; a shape is
+    converted to a tuple when first asked for and then cached.
+    """
+
+    def __init__(self, graph):
+        self._cache = {}
+        # Names are interned so they share storage with the names read from the ops
+        self._inits = {sys.intern(init.name): init for init in graph.initializer}
+        self._typed = {sys.intern(proto.name): proto
+                       for proto in itertools.chain(graph.input, graph.output, graph.value_info)}
+
+    def __contains__(self, name):
+        return name in self._typed or name in self._inits
+
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        return self.get(name)
+
+    def get(self, name, default=None):
+        """Shape of the named tensor, or default if the model doesn't list it"""
+        cache = self._cache
+        if name in cache:
+            return cache[name]
+        proto = self._typed.get(name)
+        if proto is not None:
+            shape = get_shape_from_type_proto(proto.type)
+        else:
+            init = self._inits.get(name)
+            if init is None:
+                return default
+            shape = tuple(init.dims)
+        cache[name] = shape
+        return shape
 
-    # Get shapes from outputs
-    for node in model.graph.output:
-        dim = node.type.tensor_type.shape.dim
-        shape_info[node.name] = [d.dim_param if d.dim_value == 0 else d.dim_value for d in dim]
+def make_graph():
+    """Create the empty Digraph that models are drawn into"""
+    return Digraph('ONNX Model Graph',
+                   graph_attrs={'rankdir': 'TB', 'splines': 'ortho'})
 
-    # Get shapes from value_info
-    for node in model.graph.value_info:
-        dim = node.type.tensor_type.shape.dim
-        shape_info[node.name] = [d.dim_param if d.dim_value == 0 else d.dim_value for d in dim]
+def convert_onnx_model_to_graph(model_path, dedupe=False, G=None):
+    """Convert an ONNX model to a Digraph
+
+    With dedupe=True, ops with the same type, input/output shapes and
+    attributes are drawn as one node with an instance count. Pass a
+    writer from Digraph.stream_to() as G to write each op's nodes and
+    edges to a DOT file as it is visited instead of keeping them in
+    memory; with dedupe, nodes are held back until the counts are known.
+    """
+    # Load the ONNX model with inferred shapes
+    model = load_inferred_model(model_path)
+
+    # Create a new directed graph
+    if G is None:
+        G = make_graph()
+
+    # Shapes are looked up as tuples, so they can be used as format_shape cache keys
+    shape_info = LazyShapes(model.graph)
 
     # Track nodes we've drawn
     drawn = set()
 
+    # Nodes and edges are collected and added to the graph in bulk, except
+    # that a DOT writer gets them per op so they don't pile up in memory
+    stream = isinstance(G, DotWriter)
+    nodes = []
+    edges = []
+
+    # For dedupe: op signature -> (node name, index in nodes), and instance counts
+    sig_to_repr = {}
+    sig_count = {}
+
     def draw_io(name):
         """Add input/output node if not already added"""
         if name not in drawn:
-            # Different styles for different types of nodes
-            style = {
-                'style': 'filled, rounded',
-                'shape': 'box',
-                'margin': '0.3',
-                'width': '1.8',   # Slightly wider for better text fit
-                'height': '0.6',
-                'fixedsize': 'true',
-                'fontsize': '10'
-            }
-   
-            # Clean and escape the name
             clean_label = clean_name(name)
-            escaped_name = escape_name(name)
-            shape = format_shape(shape_info.get(name, "?"))
+            shape = format_shape(shape_info.get(name) or "?")
 
             # Add node with shape info
-            G.node(escaped_name, 
-                  f"{clean_label}\\n{shape}", 
-                  attrs=style)
+            nodes.append((escape_name(name), f"{clean_label}\\n{shape}", _IO_NODE_ATTRS))
             drawn.add(name)
 
     def draw():
         """Draw the graph"""
+        # Op type prefix per domain, e.g. "ms::" for com.microsoft ops
+        domain_prefixes = {"": ""}
         for op_id, op in enumerate(model.graph.node):
             # Add operator node
             node_name = op.name or f"op_{op_id}"
-            op_type = op.op_type
-            
-            if op.domain:
-                if op.domain.startswith('com.microsoft'):
-                    op_type = f"ms::{op_type}"
-                else:
-                    op_type = f"{op.domain}::{op_type}"
+
+            domain = op.domain
+            prefix = domain_prefixes.get(domain)
+            if prefix is None:
+                prefix = "ms::" if domain.startswith('com.microsoft') else f"{domain}::"
+                domain_prefixes[domain] = prefix
+            op_type = prefix + op.op_type
             
             # Clean names and create node ID
             clean_type = clean_name(op_type)
             current_op = escape_name(node_name)
             label = f"{clean_type}\\n(#{op_id})"
 
-            G.node(current_op, 
-                  label,
-                  attrs={
-                      'shape': 'box',
-                      'style': 'filled',
-                      'fillcolor': '#e1f5fe',
-                      'margin': '0.3',
-                      'width': '1.2',
-                      'height': '0.6',
-                      'fixedsize': 'true'
-                  })
-
-            # Add edges
-            edge_style = {'penwidth': '0.5', 'arrowsize': '0.5'}
-            for input_node in op.input:
-                draw_io(input_node)
-                G.edge(escape_name(input_node), current_op, attrs=edge_style)
-            for output_node in op.output:
-                draw_io(output_node)
-                G.edge(current_op, escape_name(output_node), attrs=edge_style)
+            # Read the protobuf repeated fields once; interned names make the
+            # repeated set/dict lookups below compare by identity
+            inputs = tuple(map(sys.intern, op.input))
+            outputs = tuple(map(sys.intern, op.output))
+
+            duplicate = False
+            if dedupe:
+                sig = (op_type,
+                       tuple(shape_info.get(t) for t in inputs),
+                       tuple(shape_info.get(t) for t in outputs),
+                       tuple((a.name, a.SerializeToString()) for a in op.attribute))
+                sig_count[sig] = sig_count.get(sig, 0) + 1
+                if sig in sig_to_repr:
+                    # Wire this instance's tensors to the representative op
+                    current_op = sig_to_repr[sig][0]
+                    duplicate = True
+                else:
+                    sig_to_repr[sig] = (current_op, len(nodes))
+
+            if not duplicate:
+                nodes.append((current_op, label, _OP_NODE_ATTRS))
+
+            # Add edges in bulk
+            for tensor in inputs + outputs:
+                draw_io(tensor)
+            op_edges = itertools.chain(((escape_name(tensor), current_op) for tensor in inputs),
+                                       ((current_op, escape_name(tensor)) for tensor in outputs))
+            if stream:
+                # Dedupe still needs the node list for the instance counts
+                if not dedupe:
+                    G.add_nodes(nodes)
+                    nodes.clear()
+                G.add_edge_pairs(op_edges, _EDGE_ATTRS)
+            else:
+                edges.extend(op_edges)
+
+        # Add instance counts to deduplicated ops
+        for sig, (name, idx) in sig_to_repr.items():
+            if sig_count[sig] > 1:
+                name, label, attrs = nodes[idx]
+                nodes[idx] = (name, f"{label} ×{sig_count[sig]}", attrs)
+
+        G.add_nodes(nodes)
+        G.add_edge_pairs(edges, _EDGE_ATTRS)
 
     # Draw the graph
     draw()
     return G
 
 if __name__ == "__main__":
-    import sys
+    import argparse
     
-    model_path = sys.argv[1] if len(sys.argv) > 1 else './Llama-3.2-1B-Instruct/onnx/model.onnx'
-    print(f"Processing model: {model_path}")
+    parser = argparse.ArgumentParser(
+        description="Visualize an ONNX model graph",
+        epilog="Shape-inferred models are cached in ~/.cache/dagviz; set DAGVIZ_NO_CACHE=1 to "
+               "skip the cache. Set DAGVIZ_PROFILE=1 to print a profile of the run.")
+    parser.add_argument('model_path', nargs='?', default='./Llama-3.2-1B-Instruct/onnx/model.onnx')
+    parser.add_argument('--dedupe', action='store_true',
+                        help="draw ops with identical type, shapes and attributes once, with a count")
+    parser.add_argument('--stream', action='store_true',
+                        help="write the graph to a DOT file as it is built and lay it out with Graphviz")
+    parser.add_argument('--format', choices=['html', 'svg', 'json'],
+                        help="output format: interactive HTML page (default), Graphviz SVG, or graph "
+                             "JSON (fastest to write, for models with more than ~10k nodes); "
+                             "--stream always writes SVG")
+    args = parser.parse_args()
+    if args.stream and args.format not in (None, 'svg'):
+        parser.error("--stream lays the graph out with Graphviz and only supports --format svg")
+    output_format = args.format or 'html'
     
-    G = convert_onnx_model_to_graph(model_path)
-    if G:
-        print("Rendering graph...")
-        G.render('onnx_model_graph.html')
-        G.view() 
\ No newline at end of file
+    model_path = args.model_path
+    print(f"Processing model: {model_path}")
+
+    def run():
+        if args.stream:
+            import subprocess
+            # A private temp file, so concurrent runs can't clobber each other's DOT source
+            fd, dot_path = tempfile.mkstemp(suffix='.dot')
+            os.close(fd)
+            try:
+                with make_graph().stream_to(dot_path) as writer:
+                    convert_onnx_model_to_graph(model_path, dedupe=args.dedupe, G=writer)
+                print("Running Graphviz...")
+                subprocess.run(['dot', '-Tsvg', '-o', 'onnx_model_graph.svg', dot_path], check=True)
+            finally:
+                os.remove(dot_path)
+            print("Wrote onnx_model_graph.svg")
+        else:
+            G = convert_onnx_model_to_graph(model_path, dedupe=args.dedupe)
+            if G:
+                print("Rendering graph...")
+                G.render(f'onnx_model_graph.{output_format}', format=output_format)
+
+    # Set DAGVIZ_PROFILE=1 to print the hottest functions of a run
+    if os.environ.get('DAGVIZ_PROFILE') == '1':
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.runcall(run)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+    else:
+        run()